@@ -77,11 +77,23 @@ const PANEL_SCORES = {
     "Retina IPS": 68, "IPS": 60, "TN": 30,
 };
 
+// Log-scale bounds: RAM 4 GB → 192 GB, SSD 128 GB → 8 TB
+const RAM_LOG_RANGE = Math.log2(192) - 2;
+const SSD_LOG_MIN = 7;      // log2(128)
+const SSD_LOG_RANGE = 6;    // log2(8192) - log2(128)
+
+// Entry lists for the partial-match fallback, built once instead of per row
+const CPU_TIER_ENTRIES = Object.entries(CPU_TIERS);
+const GPU_TIER_ENTRIES = Object.entries(GPU_TIERS);
+
 // ─── Utility helpers ─────────────────────────────────────────
 
+const FLOAT_RE = /([\d.]+)/;
+const RES_RE = /(\d+)\s*[xX×]\s*(\d+)/;
+
 function parseFloat2(text) {
     if (!text) return null;
-    const m = String(text).match(/([\d.]+)/);
+    const m = FLOAT_RE.exec(typeof text === 'string' ? text : String(text));
     return m ? parseFloat(m[1]) : null;
 }
 
@@ -94,12 +106,17 @@ function escHtml(s) {
 
 // ─── Scoring functions (mirroring Python logic exactly) ──────
 
-function scoreCPU(row) {
-    const model = row.cpu_model || '';
-    const specs = row.full_specs || {};
-    let base = CPU_TIERS[model];
+// Model string → base tier score. Many laptops share a CPU/GPU model, so
+// the resolved base is cached per distinct string.
+const cpuBaseCache = new Map();
+const gpuBaseCache = new Map();
+
+function cpuBase(model) {
+    let base = cpuBaseCache.get(model);
+    if (base !== undefined) return base;
+    base = CPU_TIERS[model];
     if (base === undefined) {
-        for (const [k, v] of Object.entries(CPU_TIERS)) {
+        for (const [k, v] of CPU_TIER_ENTRIES) {
             if (model.includes(k) || k.includes(model)) { base = v; break; }
         }
     }
@@ -116,21 +133,16 @@ function scoreCPU(row) {
         else if (ml.includes('i3') || ml.includes('ryzen 3')) base = 30;
         else base = 40;
     }
-    const cores = row.cpu_core_count || 0;
-    const coreBoost = Math.min(10, (cores / 24) * 10);
-    const freqStr = specs['محدوده فرکانس پردازنده'] || '';
-    const freq = parseFloat2(freqStr);
-    let freqBoost = 0;
-    if (freq) freqBoost = Math.min(5, ((freq - 3.0) / 3.0) * 5);
-    return Math.min(100, base * 0.85 + coreBoost + freqBoost);
+    cpuBaseCache.set(model, base);
+    return base;
 }
 
-function scoreGPU(row) {
-    const model = row.gpu_model || '';
-    const specs = row.full_specs || {};
-    let base = GPU_TIERS[model];
+function gpuBase(model) {
+    let base = gpuBaseCache.get(model);
+    if (base !== undefined) return base;
+    base = GPU_TIERS[model];
     if (base === undefined) {
-        for (const [k, v] of Object.entries(GPU_TIERS)) {
+        for (const [k, v] of GPU_TIER_ENTRIES) {
             if (model.includes(k) || k.includes(model)) { base = v; break; }
         }
     }
@@ -144,6 +156,27 @@ function scoreGPU(row) {
         else if (ml.includes('m4') || ml.includes('m3')) base = 45;
         else base = 10;
     }
+    gpuBaseCache.set(model, base);
+    return base;
+}
+
+function scoreCPU(row) {
+    const model = row.cpu_model || '';
+    const specs = row.full_specs || {};
+    const base = cpuBase(model);
+    const cores = row.cpu_core_count || 0;
+    const coreBoost = Math.min(10, (cores / 24) * 10);
+    const freqStr = specs['محدوده فرکانس پردازنده'] || '';
+    const freq = parseFloat2(freqStr);
+    let freqBoost = 0;
+    if (freq) freqBoost = Math.min(5, ((freq - 3.0) / 3.0) * 5);
+    return Math.min(100, base * 0.85 + coreBoost + freqBoost);
+}
+
+function scoreGPU(row) {
+    const model = row.gpu_model || '';
+    const specs = row.full_specs || {};
+    const base = gpuBase(model);
     // VRAM boost
     const vramRaw = specs['ظرفیت حافظه گرافیکی'] || '';
     let vram = 0;
@@ -158,7 +191,7 @@ function scoreRAM(row) {
     const specs = row.full_specs || {};
     const ramMb = row.ram_mb || 8192;
     if (ramMb <= 0) return 0;
-    let logScore = (Math.log2(ramMb / 1024) - 2) / (Math.log2(192) - 2) * 90;
+    let logScore = (Math.log2(ramMb / 1024) - 2) / RAM_LOG_RANGE * 90;
     logScore = Math.max(0, Math.min(90, logScore));
     const ramType = specs['نوع RAM'] || 'DDR5';
     let typeBonus = 0;
@@ -170,7 +203,7 @@ function scoreRAM(row) {
 function scoreStorage(row) {
     const ssdGb = row.ssd_gb || 256;
     if (ssdGb <= 0) return 0;
-    const logScore = (Math.log2(ssdGb) - Math.log2(128)) / (Math.log2(8192) - Math.log2(128)) * 100;
+    const logScore = (Math.log2(ssdGb) - SSD_LOG_MIN) / SSD_LOG_RANGE * 100;
     return Math.max(0, Math.min(100, logScore));
 }
 
@@ -180,7 +213,7 @@ function scoreDisplay(row) {
     const panelScore = (PANEL_SCORES[panel] ?? 50) / 100 * 40;
 
     const resRaw = specs['حداکثر وضوح تصویر'] || '1920x1080';
-    const resMatch = String(resRaw).match(/(\d+)\s*[xX×]\s*(\d+)/);
+    const resMatch = RES_RE.exec(typeof resRaw === 'string' ? resRaw : String(resRaw));
     const pixels = resMatch ? parseInt(resMatch[1]) * parseInt(resMatch[2]) : 1920 * 1080;
     let resScore;
     if (pixels >= 2560 * 1600) resScore = 35;
@@ -256,6 +289,12 @@ async function init() {
         r._storage = round1(scoreStorage(r));
         r.ram_gb = Math.round((r.ram_mb || 0) / 1024);
         r.price_m = r.price ? round1(r.price / 1e6) : 0;
+        // Escaped once here; the table re-renders on every filter/weight change
+        r._esc_name = escHtml(r.model_code || (r.title || '').substring(0, 50));
+        r._esc_cpu = escHtml(r.cpu_model);
+        r._esc_gpu = escHtml(r.gpu_model);
+        r._esc_slug = escHtml(r.slug);
+        r._esc_img = escHtml(r.image_url);
     });
 
     // Extract brands
@@ -283,10 +322,10 @@ function round1(n) { return Math.round(n * 10) / 10; }
 
 function recalculate() {
     const w = state.weights;
-    state.processed = state.raw.map(r => {
+    state.processed = state.raw.map((r, idx) => {
         const perf = round1(r._cpu * w.cpu + r._gpu * w.gpu + r._ram * w.ram + r._display * w.display + r._storage * w.storage);
         const ppr = r.price_m > 0 ? round1((perf / r.price_m) * 100) / 100 : null;
-        return { ...r, perf_score: perf, ppr };
+        return { ...r, perf_score: perf, ppr, _idx: idx };
     });
     applyFilters();
 }
@@ -350,13 +389,20 @@ function renderStats() {
     dom.statShowing.textContent = state.filtered.length;
 
     if (state.filtered.length > 0) {
-        const scores = state.filtered.map(r => r.perf_score);
-        dom.statAvgScore.textContent = round1(scores.reduce((a, b) => a + b, 0) / scores.length);
+        // Single pass for score average, priced average and best P/P
+        let scoreSum = 0, priceSum = 0, priced = 0, best = null;
+        for (const r of state.filtered) {
+            scoreSum += r.perf_score;
+            if (r.price_m > 0) {
+                priceSum += r.price_m;
+                priced++;
+                if (best === null || (r.ppr || 0) > (best.ppr || 0)) best = r;
+            }
+        }
+        dom.statAvgScore.textContent = round1(scoreSum / state.filtered.length);
 
-        const withPrice = state.filtered.filter(r => r.price_m > 0);
-        if (withPrice.length > 0) {
-            dom.statAvgPrice.textContent = round1(withPrice.reduce((a, r) => a + r.price_m, 0) / withPrice.length) + 'M';
-            const best = withPrice.reduce((best, r) => (r.ppr || 0) > (best.ppr || 0) ? r : best, withPrice[0]);
+        if (priced > 0) {
+            dom.statAvgPrice.textContent = round1(priceSum / priced) + 'M';
             dom.statBestPP.textContent = best.ppr != null ? best.ppr.toFixed(3) : '—';
         } else {
             dom.statAvgPrice.textContent = '—';
@@ -369,6 +415,9 @@ function renderStats() {
     }
 }
 
+const THUMB_PLACEHOLDER = `<div class="thumb-placeholder">💻</div>`;
+const THUMB_ONERROR = `this.parentElement.innerHTML='<div class=\\'thumb-placeholder\\'>💻</div>'`;
+
 function renderTable() {
     const start = (state.page - 1) * state.perPage;
     const end = Math.min(start + state.perPage, state.filtered.length);
@@ -382,40 +431,39 @@ function renderTable() {
 
     dom.pageInfo.textContent = `Showing ${start + 1}–${end} of ${state.filtered.length}`;
 
-    let html = '';
+    const parts = [];
     slice.forEach((r, i) => {
+        const { perf_score: perf, ppr, price_m: priceM, _esc_img: imgSrc } = r;
         const rank = start + i + 1;
-        const tierClass = r.perf_score >= 70 ? 'tier-s' : r.perf_score >= 50 ? 'tier-a' : r.perf_score >= 30 ? 'tier-b' : 'tier-c';
-        const pprClass = (r.ppr || 0) > 0.3 ? 'ppr-good' : (r.ppr || 0) > 0.15 ? 'ppr-mid' : 'ppr-bad';
-        const pprText = r.ppr != null ? r.ppr.toFixed(3) : '—';
-        const priceText = r.price_m > 0 ? r.price_m.toFixed(1) : '—';
-        const name = escHtml(r.model_code || (r.title || '').substring(0, 50));
-        const imgSrc = r.image_url || '';
+        const tierClass = perf >= 70 ? 'tier-s' : perf >= 50 ? 'tier-a' : perf >= 30 ? 'tier-b' : 'tier-c';
+        const pprClass = (ppr || 0) > 0.3 ? 'ppr-good' : (ppr || 0) > 0.15 ? 'ppr-mid' : 'ppr-bad';
+        const pprText = ppr != null ? ppr.toFixed(3) : '—';
+        const priceText = priceM > 0 ? priceM.toFixed(1) : '—';
         const thumbHtml = imgSrc
-            ? `<img class="thumb-img" src="${escHtml(imgSrc)}" alt="" loading="lazy" onerror="this.parentElement.innerHTML='<div class=\\'thumb-placeholder\\'>💻</div>'">`
-            : `<div class="thumb-placeholder">💻</div>`;
+            ? `<img class="thumb-img" src="${imgSrc}" alt="" loading="lazy" onerror="${THUMB_ONERROR}">`
+            : THUMB_PLACEHOLDER;
 
-        html += `<tr data-idx="${state.processed.indexOf(r)}">
+        parts.push(`<tr data-idx="${r._idx}">
       <td class="cell-rank">${rank}</td>
       <td class="cell-thumb">${thumbHtml}</td>
-      <td class="cell-name"><a href="https://exo.ir/product/${escHtml(r.slug)}" target="_blank" rel="noopener">${name}</a></td>
-      <td class="cell-cpu">${escHtml(r.cpu_model)}</td>
-      <td class="cell-gpu">${escHtml(r.gpu_model)}</td>
+      <td class="cell-name"><a href="https://exo.ir/product/${r._esc_slug}" target="_blank" rel="noopener">${r._esc_name}</a></td>
+      <td class="cell-cpu">${r._esc_cpu}</td>
+      <td class="cell-gpu">${r._esc_gpu}</td>
       <td class="cell-num">${r.ram_gb}GB</td>
       <td class="cell-num">${r.ssd_gb || 0}GB</td>
-      <td class="score-cell"><div class="score-bar-wrap"><div class="score-bar-track"><div class="score-bar-fill ${tierClass}" style="width:${r.perf_score}%"></div></div><span class="score-value">${r.perf_score}</span></div></td>
+      <td class="score-cell"><div class="score-bar-wrap"><div class="score-bar-track"><div class="score-bar-fill ${tierClass}" style="width:${perf}%"></div></div><span class="score-value">${perf}</span></div></td>
       <td class="cell-num cell-price">${priceText}</td>
       <td class="cell-num cell-ppr ${pprClass}">${pprText}</td>
-    </tr>`;
+    </tr>`);
     });
-    dom.tableBody.innerHTML = html;
+    dom.tableBody.innerHTML = parts.join('');
 }
 
 function renderPagination() {
     const total = Math.ceil(state.filtered.length / state.perPage);
     if (total <= 1) { dom.pagination.innerHTML = ''; return; }
 
-    let html = `<button ${state.page <= 1 ? 'disabled' : ''} data-page="${state.page - 1}">&larr;</button>`;
+    const parts = [`<button ${state.page <= 1 ? 'disabled' : ''} data-page="${state.page - 1}">&larr;</button>`];
 
     const pages = [];
     const range = 2;
@@ -429,14 +477,14 @@ function renderPagination() {
 
     pages.forEach(p => {
         if (p === '...') {
-            html += `<span class="page-ellipsis">…</span>`;
+            parts.push(`<span class="page-ellipsis">…</span>`);
         } else {
-            html += `<button ${p === state.page ? 'class="active"' : ''} data-page="${p}">${p}</button>`;
+            parts.push(`<button ${p === state.page ? 'class="active"' : ''} data-page="${p}">${p}</button>`);
         }
     });
 
-    html += `<button ${state.page >= total ? 'disabled' : ''} data-page="${state.page + 1}">&rarr;</button>`;
-    dom.pagination.innerHTML = html;
+    parts.push(`<button ${state.page >= total ? 'disabled' : ''} data-page="${state.page + 1}">&rarr;</button>`);
+    dom.pagination.innerHTML = parts.join('');
 }
 
 function updateMethodology() {
@@ -462,11 +510,9 @@ function showDetail(idx) {
     let specsHtml = '';
     const specEntries = Object.entries(specs);
     if (specEntries.length > 0) {
-        specsHtml = `<div class="modal-specs"><h3>Full Specifications</h3><div class="spec-grid">`;
-        specEntries.forEach(([k, v]) => {
-            specsHtml += `<div class="spec-row"><div class="spec-key">${escHtml(k)}</div><div class="spec-val">${escHtml(v)}</div></div>`;
-        });
-        specsHtml += `</div></div>`;
+        const rows = specEntries.map(([k, v]) =>
+            `<div class="spec-row"><div class="spec-key">${escHtml(k)}</div><div class="spec-val">${escHtml(v)}</div></div>`);
+        specsHtml = `<div class="modal-specs"><h3>Full Specifications</h3><div class="spec-grid">${rows.join('')}</div></div>`;
     }
 
     const priceText = r.price_m > 0 ? r.price_m.toFixed(1) + 'M Rials' : 'N/A';
@@ -3,14 +3,14 @@
 Exo.ir Laptop Scraper — All-in-One
 
 Phase 1: Catalog
-  Crawls exo.ir/category/laptop page by page (120/page).
+  Crawls exo.ir/category/laptop page by page (120/page, 4 in flight).
   Stops when the FIRST out-of-stock laptop ("ناموجود") is found on a page.
   Only in-stock laptops are cataloged.
 
 Phase 2: Detail Scraper
   Scrapes each cataloged laptop's detail page for full specs + price.
   - Resumes from where it left off
-  - Writes data to DB immediately
+  - Writes data to DB as it goes (single batched writer thread)
   - 8 parallel workers
   - Retries with exponential backoff
   - Graceful Ctrl+C shutdown
@@ -19,6 +19,7 @@ Usage:
   python3 exo_laptop_scraper.py              # full run (catalog + scrape)
   python3 exo_laptop_scraper.py --catalog    # phase 1 only
   python3 exo_laptop_scraper.py --scrape     # phase 2 only (resume)
+  python3 exo_laptop_scraper.py --refresh    # re-check scraped pages (conditional GET)
 """
 
 import sqlite3
@@ -28,24 +29,42 @@ import re
 import sys
 import signal
 import argparse
+import queue
 import threading
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from functools import lru_cache
+from itertools import islice
+from pathlib import Path
 from urllib.parse import urljoin, urlparse
 
 import requests
-from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+from bs4 import BeautifulSoup, SoupStrainer
+from lxml import etree, html as lxml_html
+
+try:
+    import orjson  # optional: faster JSON parsing
+except ImportError:
+    orjson = None
 
 # ── Config ──────────────────────────────────────────────────────────────────
 BASE_URL = "https://exo.ir/category/laptop"
 DB_PATH = "laptops.db"
 ITEMS_PER_PAGE = 120
 MAX_WORKERS = 8
+SCRAPE_WINDOW = MAX_WORKERS * 4  # detail jobs submitted ahead of the workers
+CATALOG_WORKERS = 4  # catalog pages fetched concurrently
 MAX_RETRIES = 3
 RETRY_BACKOFF = 2
 REQUEST_TIMEOUT = 30
 DELAY_BETWEEN_PAGES = 2
 DELAY_BETWEEN_REQUESTS = 0.3
 MAX_PAGES = 50  # safety cap
+WRITE_BATCH_SIZE = 50  # detail rows per writer transaction
+WRITE_FLUSH_INTERVAL = 0.2  # max seconds a scraped row waits for its batch
+WRITE_QUEUE_SIZE = 256  # workers block (backpressure) if the writer falls behind
+SQLITE_CACHE_KIB = 64000  # page cache per connection (cache_size=-N is KiB)
 
 HEADERS = {
     "User-Agent": (
@@ -56,6 +75,34 @@ HEADERS = {
     "Accept-Language": "en-US,en;q=0.9,fa;q=0.8",
 }
 
+# Precompiled patterns (hot path: every catalog card / detail field)
+_NUM_RE = re.compile(r"([\d.]+)")
+_NONDIGIT_RE = re.compile(r"[^\d]")
+_CORES_RE = re.compile(r"(\d+)\s*هسته")
+_THREADS_RE = re.compile(r"(\d+)\s*رشته")
+_MODEL_RE = re.compile(r"مدل کالا:\s*(.+)")
+
+# Catalog pages are only read for their product cards, so let lxml build
+# those subtrees alone. Matched on the raw class attribute, hence the regex
+# rather than class_="grid-product" (cards carry several classes).
+_GRID_STRAINER = SoupStrainer("div", class_=re.compile(r"(?:^|\s)grid-product(?:\s|$)"))
+
+# Detail-page row queries, compiled once (class test = whole-token match like _has_class)
+_XP_KEY_ROWS = etree.XPath(".//div[contains(concat(' ', normalize-space(@class), ' '), ' d-flex ')]")
+_XP_SPEC_ROWS = etree.XPath("(.//table)[1]//tr")
+_XP_CELLS = etree.XPath(".//td")
+
+# orjson.JSONDecodeError subclasses json.JSONDecodeError, so callers only
+# need to catch the stdlib exception.
+_json_loads = orjson.loads if orjson else json.loads
+
+
+def _json_dumps(obj) -> str:
+    """Compact UTF-8 JSON text (orjson when available)."""
+    if orjson:
+        return orjson.dumps(obj).decode()
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+
 # Graceful shutdown
 shutdown_event = threading.Event()
 
@@ -69,12 +116,78 @@ signal.signal(signal.SIGINT, signal_handler)
 signal.signal(signal.SIGTERM, signal_handler)
 
 
+# ══════════════════════════════════════════════════════════════════════════════
+#  HTTP
+# ══════════════════════════════════════════════════════════════════════════════
+def new_session() -> requests.Session:
+    """Session carrying HEADERS, with a keep-alive pool sized for MAX_WORKERS."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=MAX_WORKERS, pool_maxsize=MAX_WORKERS * 2, max_retries=0)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update(HEADERS)
+    return session
+
+
+# One pool shared by every thread, so keep-alive sockets are reused across workers
+_SESSION = new_session()
+
+
+class TokenBucket:
+    """Host-wide rate limiter: acquire() returns at most once per interval."""
+
+    def __init__(self, interval: float):
+        self._interval = interval
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        with self._lock:
+            now = time.monotonic()
+            wait = max(0.0, self._next - now)
+            self._next = max(now, self._next) + self._interval
+        if wait:
+            time.sleep(wait)
+
+
 # ══════════════════════════════════════════════════════════════════════════════
 #  DATABASE
 # ══════════════════════════════════════════════════════════════════════════════
+def connect_db(db_path: str = DB_PATH, timeout: float = 30,
+               isolation_level: str | None = "") -> sqlite3.Connection:
+    """
+    Open a write connection.
+    journal_mode=WAL persists in the file, but synchronous/temp_store/cache_size/
+    mmap_size are per-connection, so they are applied on every connect. NORMAL
+    is safe under WAL and skips the fsync on each commit. `timeout` is the busy
+    timeout.
+    Pass isolation_level=None for autocommit with explicit BEGIN/COMMIT.
+    """
+    conn = sqlite3.connect(db_path, timeout=timeout, isolation_level=isolation_level)
+    conn.execute("PRAGMA synchronous=NORMAL;")
+    conn.execute("PRAGMA temp_store=MEMORY;")
+    conn.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_KIB};")
+    conn.execute("PRAGMA mmap_size=268435456;")
+    return conn
+
+
+def connect_ro(db_path: str = DB_PATH) -> sqlite3.Connection:
+    """
+    Open a read-only connection (reports, export, pending lookup).
+    Under WAL it reads a snapshot and never takes the write lock, so it can't
+    stall the writer thread.
+    """
+    conn = sqlite3.connect(f"{Path(db_path).resolve().as_uri()}?mode=ro", uri=True)
+    conn.execute("PRAGMA query_only=1;")
+    conn.execute("PRAGMA temp_store=MEMORY;")
+    conn.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_KIB};")
+    conn.execute("PRAGMA mmap_size=268435456;")
+    return conn
+
+
 def init_db(db_path: str = DB_PATH) -> None:
     """Create both tables if they don't exist."""
-    conn = sqlite3.connect(db_path)
+    conn = connect_db(db_path)
     conn.execute("PRAGMA journal_mode=WAL;")
     conn.execute(
         """
@@ -116,10 +229,33 @@ def init_db(db_path: str = DB_PATH) -> None:
             full_specs_json     TEXT,
             image_url           TEXT,
             scraped_at          TEXT DEFAULT (datetime('now')),
+            etag                TEXT,
+            last_modified       TEXT,
             UNIQUE(laptop_id)
         );
         """
     )
+    # Phase 2's pending scan; holds only unscraped rows, so it empties as work finishes
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS ix_laptops_pending ON laptops(id) WHERE scraped_details = 0;"
+    )
+    # Databases created before the HTTP validator columns existed
+    cols = {r[1] for r in conn.execute("PRAGMA table_info(laptop_details)")}
+    for col in ("etag", "last_modified"):
+        if col not in cols:
+            conn.execute(f"ALTER TABLE laptop_details ADD COLUMN {col} TEXT")
+    conn.commit()
+    conn.close()
+
+
+def finalize_db(db_path: str = DB_PATH) -> None:
+    """
+    End-of-run upkeep: fold the WAL back into the main file and truncate it,
+    then refresh planner statistics for the next run's queries.
+    """
+    conn = connect_db(db_path)
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE);")
+    conn.execute("ANALYZE;")
     conn.commit()
     conn.close()
 
@@ -144,13 +280,11 @@ def scrape_catalog_page(page_num: int, session: requests.Session) -> tuple[list[
     if page_num > 1:
         params["page"] = page_num
 
-    print(f"  📄 Page {page_num} … ", end="", flush=True)
-
-    resp = session.get(BASE_URL, params=params, headers=HEADERS, timeout=REQUEST_TIMEOUT)
+    resp = session.get(BASE_URL, params=params, timeout=REQUEST_TIMEOUT)
     resp.raise_for_status()
-    print(f"HTTP {resp.status_code}  ", end="", flush=True)
 
-    soup = BeautifulSoup(resp.text, "lxml")
+    soup = BeautifulSoup(resp.content, "lxml", parse_only=_GRID_STRAINER,
+                         from_encoding=resp.encoding)
 
     laptops = []
     should_continue = True
@@ -159,7 +293,6 @@ def scrape_catalog_page(page_num: int, session: requests.Session) -> tuple[list[
     product_cards = soup.select("div.grid-product")
 
     if not product_cards:
-        print("→ 0 products (empty page)")
         return [], False
 
     for card in product_cards:
@@ -173,7 +306,7 @@ def scrape_catalog_page(page_num: int, session: requests.Session) -> tuple[list[
         link = card.select_one("a.font-latin-yekan.text-truncate-2")
         if not link:
             # fallback: any link to /product/
-            link = card.find("a", href=re.compile(r"/product/"))
+            link = card.find("a", href=lambda h: h and "/product/" in h)
         if not link:
             continue
 
@@ -187,8 +320,6 @@ def scrape_catalog_page(page_num: int, session: requests.Session) -> tuple[list[
 
         laptops.append({"slug": slug, "name": name, "url": full_url})
 
-    status = "→" if should_continue else "→ ⛔"
-    print(f"{status} {len(laptops)} in-stock laptops")
     return laptops, should_continue
 
 
@@ -198,50 +329,73 @@ def run_catalog(db_path: str = DB_PATH) -> int:
     print("PHASE 1: Catalog in-stock laptops")
     print("─" * 60)
 
-    conn = sqlite3.connect(db_path)
+    conn = connect_db(db_path)
     before = conn.execute("SELECT COUNT(*) FROM laptops").fetchone()[0]
     print(f"  Existing in DB: {before}")
     print(f"  Crawling pages until out-of-stock found…\n")
 
-    session = requests.Session()
+    # Page requests start at most once per DELAY_BETWEEN_PAGES / CATALOG_WORKERS
+    # (0.5s by default). That is CATALOG_WORKERS times the old serial crawl,
+    # which waited DELAY_BETWEEN_PAGES plus the fetch time between pages.
+    bucket = TokenBucket(DELAY_BETWEEN_PAGES / CATALOG_WORKERS)
     total_found = 0
+    new = 0
 
-    for page in range(1, MAX_PAGES + 1):
-        if shutdown_event.is_set():
-            break
+    def fetch(page: int) -> tuple[list[dict], bool]:
+        bucket.acquire()
+        return scrape_catalog_page(page, _SESSION)
 
-        try:
-            laptops, should_continue = scrape_catalog_page(page, session)
-        except requests.RequestException as e:
-            print(f"  ⚠ Error on page {page}: {e}. Retrying…")
-            time.sleep(5)
-            try:
-                laptops, should_continue = scrape_catalog_page(page, session)
-            except requests.RequestException as e2:
-                print(f"  ✗ Page {page} failed again: {e2}. Stopping catalog.")
+    # Keep CATALOG_WORKERS pages in flight, but consume them in page order so
+    # the out-of-stock stop rule sees pages exactly as the serial crawl did.
+    executor = ThreadPoolExecutor(max_workers=CATALOG_WORKERS)
+    window = deque()
+    next_page = 1
+    try:
+        while next_page <= min(CATALOG_WORKERS, MAX_PAGES):
+            window.append((next_page, executor.submit(fetch, next_page)))
+            next_page += 1
+
+        while window:
+            if shutdown_event.is_set():
                 break
 
-        # Insert into DB
-        for lap in laptops:
+            page, future = window.popleft()
             try:
-                conn.execute(
+                laptops, should_continue = future.result()
+            except requests.RequestException as e:
+                print(f"  ⚠ Error on page {page}: {e}. Retrying…")
+                time.sleep(5)
+                try:
+                    laptops, should_continue = fetch(page)
+                except requests.RequestException as e2:
+                    print(f"  ✗ Page {page} failed again: {e2}. Stopping catalog.")
+                    break
+
+            status = "→" if should_continue else "→ ⛔"
+            print(f"  📄 Page {page} {status} {len(laptops)} in-stock laptops")
+
+            # Insert into DB — one transaction per page
+            # (rowcount counts only rows actually inserted, not ignored duplicates)
+            with conn:
+                cur = conn.executemany(
                     "INSERT OR IGNORE INTO laptops (slug, name, url) VALUES (?, ?, ?)",
-                    (lap["slug"], lap["name"], lap["url"]),
+                    [(lap["slug"], lap["name"], lap["url"]) for lap in laptops],
                 )
-            except sqlite3.IntegrityError:
-                pass
-        conn.commit()
-        total_found += len(laptops)
+            new += cur.rowcount
+            total_found += len(laptops)
 
-        if not should_continue:
-            print(f"\n  ⛔ Out-of-stock product found on page {page}. Stopping catalog.")
-            break
+            if not should_continue:
+                print(f"\n  ⛔ Out-of-stock product found on page {page}. Stopping catalog.")
+                break
 
-        if page < MAX_PAGES:
-            time.sleep(DELAY_BETWEEN_PAGES)
+            if next_page <= MAX_PAGES:
+                window.append((next_page, executor.submit(fetch, next_page)))
+                next_page += 1
+    finally:
+        # Pages queued past the stop point are never needed
+        executor.shutdown(wait=True, cancel_futures=True)
 
-    after = conn.execute("SELECT COUNT(*) FROM laptops").fetchone()[0]
-    new = after - before
+    after = before + new
     conn.close()
 
     print(f"\n  Total found this run:  {total_found}")
@@ -253,45 +407,53 @@ def run_catalog(db_path: str = DB_PATH) -> int:
 # ══════════════════════════════════════════════════════════════════════════════
 #  NUMERIC PROCESSING
 # ══════════════════════════════════════════════════════════════════════════════
+# Spec strings repeat heavily across a catalog ("16 گیگابایت", "1 ترابایت", …),
+# so each parser is memoized on its raw text.
+@lru_cache(maxsize=2048)
 def parse_ram_mb(text: str) -> int | None:
     if not text or text == "ندارد":
         return None
-    m = re.search(r"([\d.]+)", text)
+    m = _NUM_RE.search(text)
     if not m:
         return None
     val = float(m.group(1))
-    if "ترابایت" in text or "TB" in text.upper():
+    low = text.lower()  # folds the ASCII units; Persian units are unaffected
+    if "ترابایت" in low or "tb" in low:
         return int(val * 1024 * 1024)
-    if "مگابایت" in text or "MB" in text.upper():
+    if "مگابایت" in low or "mb" in low:
         return int(val)
     return int(val * 1024)  # default GB
 
 
+@lru_cache(maxsize=2048)
 def parse_storage_gb(text: str) -> int | None:
     if not text or text == "ندارد":
         return 0
-    m = re.search(r"([\d.]+)", text)
+    m = _NUM_RE.search(text)
     if not m:
         return None
     val = float(m.group(1))
-    if "ترابایت" in text or "TB" in text.upper():
+    low = text.lower()  # folds the ASCII units; Persian units are unaffected
+    if "ترابایت" in low or "tb" in low:
         return int(val * 1024)
-    if "مگابایت" in text or "MB" in text.upper():
+    if "مگابایت" in low or "mb" in low:
         return max(1, int(val / 1024))
     return int(val)  # default GB
 
 
+@lru_cache(maxsize=2048)
 def parse_screen_inches(text: str) -> float | None:
     if not text:
         return None
-    m = re.search(r"([\d.]+)", text)
+    m = _NUM_RE.search(text)
     return float(m.group(1)) if m else None
 
 
+@lru_cache(maxsize=2048)
 def parse_weight_kg(text: str) -> float | None:
     if not text:
         return None
-    m = re.search(r"([\d.]+)", text)
+    m = _NUM_RE.search(text)
     if not m:
         return None
     val = float(m.group(1))
@@ -300,64 +462,166 @@ def parse_weight_kg(text: str) -> float | None:
     return val
 
 
+@lru_cache(maxsize=2048)
 def parse_cpu_cores(text: str) -> int | None:
     if not text:
         return None
-    m = re.search(r"(\d+)\s*هسته", text)
+    m = _CORES_RE.search(text)
     return int(m.group(1)) if m else None
 
 
+@lru_cache(maxsize=2048)
 def parse_cpu_threads(text: str) -> int | None:
     if not text:
         return None
-    m = re.search(r"(\d+)\s*رشته", text)
+    m = _THREADS_RE.search(text)
     return int(m.group(1)) if m else None
 
 
+_SQLITE_INT_MIN, _SQLITE_INT_MAX = -2**63, 2**63 - 1
+
+
+def _null_on_error(fn):
+    # An exception inside an SQL function, or an int SQLite can't hold, aborts
+    # the whole UPDATE; a malformed value (a lone "." matched by _NUM_RE, a
+    # 400-digit number that overflows int(float)) should only null its own cell.
+    def wrapper(text):
+        try:
+            val = fn(text)
+        except (ValueError, OverflowError):
+            return None
+        if isinstance(val, int) and not _SQLITE_INT_MIN <= val <= _SQLITE_INT_MAX:
+            return None
+        return val
+    return wrapper
+
+
+def derive_numeric_columns(conn: sqlite3.Connection) -> int:
+    """
+    Recompute the parsed numeric columns (ram_mb, ssd_gb, …) from their raw
+    spec text in one UPDATE, so the scrape workers only store text.
+    Covers every row, so parser fixes reach old rows on the next scrape run.
+    """
+    for name, fn in (
+        ("parse_ram_mb", parse_ram_mb),
+        ("parse_storage_gb", parse_storage_gb),
+        ("parse_screen_inches", parse_screen_inches),
+        ("parse_weight_kg", parse_weight_kg),
+        ("parse_cpu_cores", parse_cpu_cores),
+        ("parse_cpu_threads", parse_cpu_threads),
+    ):
+        conn.create_function(name, 1, _null_on_error(fn), deterministic=True)
+    with conn:
+        cur = conn.execute(
+            """
+            UPDATE laptop_details SET
+                ram_mb           = parse_ram_mb(ram),
+                ssd_gb           = parse_storage_gb(ssd),
+                hdd_gb           = parse_storage_gb(hdd),
+                screen_inches    = parse_screen_inches(screen_size),
+                weight_kg        = parse_weight_kg(weight),
+                cpu_core_count   = parse_cpu_cores(cpu_cores),
+                cpu_thread_count = parse_cpu_threads(cpu_cores)
+            """
+        )
+    return cur.rowcount
+
+
 # ══════════════════════════════════════════════════════════════════════════════
 #  PHASE 2 — DETAIL SCRAPER
 # ══════════════════════════════════════════════════════════════════════════════
 def parse_price(text: str) -> int | None:
-    digits = re.sub(r"[^\d]", "", text)
+    digits = _NONDIGIT_RE.sub("", text)
     return int(digits) if digits else None
 
 
-def extract_key_specs(soup: BeautifulSoup) -> dict:
-    specs = {}
-    h = soup.find("h6", string=re.compile(r"خصوصیات کلیدی"))
-    if not h:
-        return specs
-    container = h.find_parent("div")
-    if not container:
-        return specs
-    for div in container.find_all("div", class_="d-flex"):
-        label_el = div.find("span", class_="text-black-50")
-        if not label_el:
+def _text(el) -> str:
+    """Element text with each fragment stripped, like bs4's get_text(strip=True)."""
+    return "".join(s.strip() for s in el.itertext())
+
+
+def _has_class(el, cls: str) -> bool:
+    return cls in el.get("class", "").split()
+
+
+def _find(el, tag: str, cls: str | None = None):
+    """First descendant <tag> (optionally carrying class `cls`), or None."""
+    for child in el.iterdescendants(tag):
+        if cls is None or _has_class(child, cls):
+            return child
+    return None
+
+
+def _locate_sections(doc) -> dict:
+    """
+    One pass over the document collecting the first node of each section the
+    detail parser reads: title/price headings, model and key-specs h6, and the
+    spec-table / image containers by id.
+    """
+    found = {}
+    for el in doc.iter(etree.Element):
+        tag = el.tag
+        if tag == "h1":
+            if "title" not in found and _has_class(el, "fw-bold"):
+                found["title"] = el
+        elif tag == "h2":
+            if "price" not in found and _has_class(el, "fw-bold"):
+                found["price"] = el
+        elif tag == "h6":
+            if "model" in found and "key_specs" in found:
+                continue
+            t = _text(el)
+            if "model" not in found and _has_class(el, "text-secondary") and "مدل کالا" in t:
+                found["model"] = el
+            if "key_specs" not in found and "خصوصیات کلیدی" in t:
+                found["key_specs"] = el
+        el_id = el.get("id")
+        if el_id == "tab-specification" and "full_specs" not in found:
+            found["full_specs"] = el
+        elif el_id == "zoom-preview-area" and "image" not in found:
+            found["image"] = el
+    return found
+
+
+def extract_key_specs_into(h, details: dict) -> None:
+    """
+    Write key-spec rows under the 'خصوصیات کلیدی' heading `h` straight into
+    `details`, mapped through KEY_SPEC_MAP; unmapped labels are skipped before
+    their value is read.
+    """
+    if h is None:
+        return
+    container = next(h.iterancestors("div"), None)
+    if container is None:
+        return
+    for div in _XP_KEY_ROWS(container):
+        label_el = _find(div, "span", "text-black-50")
+        if label_el is None:
+            continue
+        label_text = _text(label_el)
+        label = label_text.rstrip(": \u200c\u200b").strip()
+        dk = KEY_SPEC_MAP.get(label)
+        if dk is None:
             continue
-        label = label_el.get_text(strip=True).rstrip(": \u200c\u200b").strip()
-        value_el = div.find("span", class_="text-dark")
-        if value_el:
-            value = value_el.get_text(strip=True)
+        value_el = _find(div, "span", "text-dark")
+        if value_el is not None:
+            value = _text(value_el)
         else:
-            value = div.get_text(strip=True).replace(label_el.get_text(strip=True), "").strip()
-        if label and value:
-            specs[label] = value
-    return specs
+            value = _text(div).replace(label_text, "").strip()
+        if value:
+            details[dk] = value
 
 
-def extract_full_specs(soup: BeautifulSoup) -> dict:
+def extract_full_specs(tab) -> dict:
+    """Label/value rows of the first table in #tab-specification (`tab`)."""
     specs = {}
-    tab = soup.find(id="tab-specification")
-    if not tab:
-        return specs
-    table = tab.find("table")
-    if not table:
+    if tab is None:
         return specs
-    for row in table.find_all("tr"):
-        cells = row.find_all("td")
+    for row in _XP_SPEC_ROWS(tab):
+        cells = _XP_CELLS(row)
         if len(cells) >= 2:
-            k = cells[0].get_text(strip=True)
-            v = cells[1].get_text(strip=True)
+            k = _text(cells[0])
+            v = _text(cells[1])
             if k:
                 specs[k] = v
     return specs
@@ -389,164 +653,250 @@ FULL_SPEC_FALLBACK = {
 }
 
 
-def scrape_laptop_detail(laptop: dict, session: requests.Session) -> dict:
-    resp = session.get(laptop["url"], headers=HEADERS, timeout=REQUEST_TIMEOUT)
+def scrape_laptop_detail(laptop: dict, session: requests.Session) -> dict | None:
+    """
+    Fetch and parse one detail page.
+    Returns None when the server answers 304 to the stored ETag/Last-Modified,
+    i.e. the page is unchanged since the previous scrape.
+    """
+    cond = {}
+    if laptop.get("etag"):
+        cond["If-None-Match"] = laptop["etag"]
+    if laptop.get("last_modified"):
+        cond["If-Modified-Since"] = laptop["last_modified"]
+    resp = session.get(laptop["url"], headers=cond, timeout=REQUEST_TIMEOUT)
+    if resp.status_code == 304:
+        return None
     resp.raise_for_status()
-    soup = BeautifulSoup(resp.text, "lxml")
+    # Feed the raw body; decode with the same charset resp.text would use
+    doc = lxml_html.document_fromstring(
+        resp.content, parser=lxml_html.HTMLParser(encoding=resp.encoding)
+    )
 
-    details = {"slug": laptop["slug"]}
+    details = {
+        "slug": laptop["slug"],
+        "etag": resp.headers.get("ETag"),
+        "last_modified": resp.headers.get("Last-Modified"),
+    }
+
+    sections = _locate_sections(doc)
 
     # Title
-    title_el = soup.find("h1", class_="fw-bold")
-    if title_el:
-        details["title"] = title_el.get_text(strip=True)
+    title_el = sections.get("title")
+    if title_el is not None:
+        details["title"] = _text(title_el)
 
     # Model code
-    model_el = soup.find("h6", class_="text-secondary", string=re.compile(r"مدل کالا"))
-    if model_el:
-        m = re.search(r"مدل کالا:\s*(.+)", model_el.get_text(strip=True))
+    model_el = sections.get("model")
+    if model_el is not None:
+        m = _MODEL_RE.search(_text(model_el))
         if m:
             details["model_code"] = m.group(1).strip()
 
     # Price
-    price_el = soup.find("h2", class_="fw-bold")
-    if price_el:
-        pt = price_el.get_text(strip=True)
+    price_el = sections.get("price")
+    if price_el is not None:
+        pt = _text(price_el)
         if "تومان" in pt:
             details["price"] = parse_price(pt)
 
-    # Key specs
-    key_specs = extract_key_specs(soup)
-    for fk, dk in KEY_SPEC_MAP.items():
-        if fk in key_specs:
-            details[dk] = key_specs[fk]
-
     # Full spec table
-    full_specs = extract_full_specs(soup)
+    full_specs = extract_full_specs(sections.get("full_specs"))
     if full_specs:
-        details["full_specs_json"] = json.dumps(full_specs, ensure_ascii=False)
-
-    # Fallback from full specs
-    for sk, dk in FULL_SPEC_FALLBACK.items():
-        if dk not in details or details[dk] is None:
-            if sk in full_specs:
-                details[dk] = full_specs[sk]
-
-    # Numeric processing
-    details["ram_mb"] = parse_ram_mb(details.get("ram"))
-    details["ssd_gb"] = parse_storage_gb(details.get("ssd"))
-    details["hdd_gb"] = parse_storage_gb(details.get("hdd"))
-    details["screen_inches"] = parse_screen_inches(details.get("screen_size"))
-    details["weight_kg"] = parse_weight_kg(details.get("weight"))
-    details["cpu_core_count"] = parse_cpu_cores(details.get("cpu_cores"))
-    details["cpu_thread_count"] = parse_cpu_threads(details.get("cpu_cores"))
+        details["full_specs_json"] = _json_dumps(full_specs)
+
+    # Spec fields: full-table values as the base, key specs take precedence
+    details.update({dk: full_specs[sk] for sk, dk in FULL_SPEC_FALLBACK.items() if sk in full_specs})
+    extract_key_specs_into(sections.get("key_specs"), details)
 
     # Image — look in zoom-preview-area for the main product photo
-    zoom_area = soup.find(id="zoom-preview-area")
-    if zoom_area:
-        img_el = zoom_area.find("img")
+    zoom_area = sections.get("image")
+    if zoom_area is not None:
+        img_el = _find(zoom_area, "img")
     else:
         img_el = None
-    if img_el and img_el.get("src"):
+    if img_el is not None and img_el.get("src"):
         src = img_el.get("src")
         details["image_url"] = src if src.startswith("http") else urljoin("https://exo.ir", src)
 
     return details
 
 
-def save_detail(laptop_id: int, details: dict, db_path: str = DB_PATH) -> None:
-    conn = sqlite3.connect(db_path, timeout=30)
+# Columns written per laptop, in details-dict key order (laptop_id comes first)
+DETAIL_COLS = (
+    "slug", "title", "model_code", "price",
+    "cpu_model", "cpu_cores", "ram", "gpu_model", "hdd", "ssd",
+    "screen_size", "laptop_series", "weight",
+    "full_specs_json", "image_url",
+    "etag", "last_modified",
+)
+# Upsert in place on UNIQUE(laptop_id): keeps the row's id, unlike OR REPLACE's
+# delete + re-insert
+UPSERT_SQL = f"""
+    INSERT INTO laptop_details (laptop_id, {", ".join(DETAIL_COLS)})
+    VALUES (?{", ?" * len(DETAIL_COLS)})
+    ON CONFLICT(laptop_id) DO UPDATE SET
+        {", ".join(f"{c} = excluded.{c}" for c in DETAIL_COLS)},
+        scraped_at = datetime('now')
+"""
+UPDATE_SQL = "UPDATE laptops SET scraped_details = 1 WHERE id = ?"
+
+
+def save_details(cur: sqlite3.Cursor, batch: list[tuple[int, dict]]) -> None:
+    """
+    Write a batch of (laptop_id, details) and mark them scraped, in one transaction.
+    details is None for pages that came back 304; those are only marked scraped.
+    `cur` must belong to an autocommit (isolation_level=None) connection; the
+    transaction is opened and closed explicitly.
+    """
+    cur.execute("BEGIN")
     try:
-        conn.execute(
-            """
-            INSERT OR REPLACE INTO laptop_details
-                (laptop_id, slug, title, model_code, price,
-                 cpu_model, cpu_cores, ram, gpu_model, hdd, ssd,
-                 screen_size, laptop_series, weight,
-                 ram_mb, ssd_gb, hdd_gb, screen_inches, weight_kg,
-                 cpu_core_count, cpu_thread_count, full_specs_json, image_url)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """,
-            (
-                laptop_id, details.get("slug", ""), details.get("title"),
-                details.get("model_code"), details.get("price"),
-                details.get("cpu_model"), details.get("cpu_cores"),
-                details.get("ram"), details.get("gpu_model"),
-                details.get("hdd"), details.get("ssd"),
-                details.get("screen_size"), details.get("laptop_series"),
-                details.get("weight"),
-                details.get("ram_mb"), details.get("ssd_gb"),
-                details.get("hdd_gb"), details.get("screen_inches"),
-                details.get("weight_kg"),
-                details.get("cpu_core_count"), details.get("cpu_thread_count"),
-                details.get("full_specs_json"), details.get("image_url"),
-            ),
+        cur.executemany(
+            UPSERT_SQL,
+            [
+                (laptop_id, *(details.get(c) for c in DETAIL_COLS))
+                for laptop_id, details in batch
+                if details is not None
+            ],
         )
-        conn.execute("UPDATE laptops SET scraped_details = 1 WHERE id = ?", (laptop_id,))
-        conn.commit()
+        cur.executemany(UPDATE_SQL, [(laptop_id,) for laptop_id, _ in batch])
+        cur.execute("COMMIT")
+    except BaseException:
+        if cur.connection.in_transaction:
+            cur.execute("ROLLBACK")
+        raise
+
+
+# Workers hand scraped rows to a single writer thread, which owns the only
+# write connection and commits them in batches. None is the stop sentinel.
+_write_q: queue.Queue = queue.Queue(maxsize=WRITE_QUEUE_SIZE)
+# Set when the writer thread exits, normally or not; producers stop waiting on it
+_writer_stopped = threading.Event()
+
+
+def _put_write(item) -> bool:
+    """Queue `item` for the writer. False if the writer has stopped (never blocks forever)."""
+    while not _writer_stopped.is_set():
+        try:
+            _write_q.put(item, timeout=1.0)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _writer(db_path: str = DB_PATH, unsaved: list[int] | None = None) -> None:
+    """
+    Drain _write_q into the DB in batches until the None sentinel.
+    Ids of laptops whose row failed to commit, or that the writer still held
+    when it died, are appended to `unsaved`.
+    """
+    conn = None
+    batch = []
+    try:
+        conn = connect_db(db_path, isolation_level=None)
+        # One long-lived cursor: the two statements stay prepared across batches
+        cur = conn.cursor()
+        stop = False
+        while not stop:
+            item = _write_q.get()
+            if item is None:
+                break
+            batch = [item]
+            deadline = time.monotonic() + WRITE_FLUSH_INTERVAL
+            while len(batch) < WRITE_BATCH_SIZE:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = _write_q.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+            try:
+                save_details(cur, batch)
+            except Exception:
+                # Some row can't be written (e.g. a value sqlite3 can't bind).
+                # Retry row by row so only the bad ones are skipped; they stay
+                # as they were and are retried on the next run
+                for entry in batch:
+                    try:
+                        save_details(cur, [entry])
+                    except Exception as e:
+                        print(f"  ✗ DB write failed for #{entry[0]}: {e}")
+                        if unsaved is not None:
+                            unsaved.append(entry[0])
+            batch = []
     finally:
-        conn.close()
+        # A batch still held here was taken off the queue but never handled
+        if unsaved is not None:
+            unsaved.extend(laptop_id for laptop_id, _ in batch)
+        _writer_stopped.set()
+        if conn is not None:
+            conn.close()
+
 
 def export_to_json(db_path: str = DB_PATH, json_path: str = "laptops.json") -> None:
     """Export the laptops_details table to a JSON file format suitable for the web UI."""
     print(f"\n  Exporting DB to {json_path}...")
-    conn = sqlite3.connect(db_path)
+    conn = connect_ro(db_path)
     conn.row_factory = sqlite3.Row
-    rows = conn.execute("SELECT * FROM laptop_details").fetchall()
-    conn.close()
 
+    # Iterate the cursor directly rather than fetchall() so rows are converted
+    # one at a time instead of holding a second full copy of the table.
     export_data = []
-    for r in rows:
+    for r in conn.execute("SELECT * FROM laptop_details"):
         d = dict(r)
-        
-        # We don't need to send the full huge string to the frontend if we just want key specs, 
+
+        # We don't need to send the full huge string to the frontend if we just want key specs,
         # but let's parse it so frontend can use it if we want to show advanced details.
-        if d.get("full_specs_json"):
+        # Remove the raw string to save space in the JSON payload.
+        blob = d.pop("full_specs_json", None)
+        # HTTP cache validators are scraper bookkeeping, not laptop data
+        d.pop("etag", None)
+        d.pop("last_modified", None)
+        if blob:
             try:
-                d["full_specs"] = json.loads(d["full_specs_json"])
+                d["full_specs"] = _json_loads(blob)
             except json.JSONDecodeError:
                 d["full_specs"] = {}
         else:
             d["full_specs"] = {}
-        
-        # Remove the raw string to save space in the JSON payload
-        d.pop("full_specs_json", None)
-        
+
         export_data.append(d)
+    conn.close()
 
     with open(json_path, "w", encoding="utf-8") as f:
         json.dump(export_data, f, ensure_ascii=False, indent=2)
     print(f"  ✓ Exported {len(export_data)} laptops to {json_path}")
 
 
-# Thread-local sessions
-_tl = threading.local()
-_stats_lock = threading.Lock()
-_stats = {"success": 0, "failed": 0}
-
-
-def _get_session() -> requests.Session:
-    if not hasattr(_tl, "session"):
-        _tl.session = requests.Session()
-    return _tl.session
+# Shared by all workers: one detail request starts at most every
+# DELAY_BETWEEN_REQUESTS / MAX_WORKERS seconds fleet-wide (~27/s by default),
+# regardless of response latency. The old per-worker sleeps gave
+# MAX_WORKERS / (DELAY_BETWEEN_REQUESTS + latency), so this is a higher cap.
+_request_bucket = TokenBucket(DELAY_BETWEEN_REQUESTS / MAX_WORKERS)
 
 
-def _worker(laptop: dict, db_path: str = DB_PATH) -> tuple[int, bool, str]:
+def _worker(laptop: dict) -> tuple[int, bool, str]:
     if shutdown_event.is_set():
         return (laptop["id"], False, "shutdown")
 
-    session = _get_session()
     last_err = ""
 
     for attempt in range(1, MAX_RETRIES + 1):
         if shutdown_event.is_set():
             return (laptop["id"], False, "shutdown")
         try:
-            time.sleep(DELAY_BETWEEN_REQUESTS)
-            details = scrape_laptop_detail(laptop, session)
-            save_detail(laptop["id"], details, db_path)
-            with _stats_lock:
-                _stats["success"] += 1
+            _request_bucket.acquire()
+            details = scrape_laptop_detail(laptop, _SESSION)
+            if not _put_write((laptop["id"], details)):
+                return (laptop["id"], False, "FAILED: DB writer stopped")
+            if details is None:
+                return (laptop["id"], True, "not modified (304)")
             return (laptop["id"], True, f"OK (price={details.get('price')})")
         except requests.RequestException as e:
             last_err = str(e)
@@ -557,68 +907,134 @@ def _worker(laptop: dict, db_path: str = DB_PATH) -> tuple[int, bool, str]:
             if attempt < MAX_RETRIES:
                 time.sleep(RETRY_BACKOFF)
 
-    with _stats_lock:
-        _stats["failed"] += 1
     return (laptop["id"], False, f"FAILED: {last_err}")
 
 
-def run_scrape(db_path: str = DB_PATH) -> None:
-    """Phase 2: Scrape detail pages for all pending laptops."""
+def iter_pending_laptops(db_path: str = DB_PATH, refresh: bool = False):
+    """
+    Yield unscraped laptops (with stored HTTP validators) lazily, in id order.
+    With refresh=True, already scraped laptops are yielded too, so they are
+    re-checked by conditional GET; their scraped_details flag is left alone.
+    """
+    where = "" if refresh else "WHERE l.scraped_details = 0"
+    conn = connect_ro(db_path)
+    try:
+        cur = conn.execute(
+            f"""
+            SELECT l.id, l.slug, l.url, d.etag, d.last_modified
+            FROM laptops l LEFT JOIN laptop_details d ON d.laptop_id = l.id
+            {where}
+            ORDER BY l.id
+            """
+        )
+        for r in cur:
+            yield {"id": r[0], "slug": r[1], "url": r[2], "etag": r[3], "last_modified": r[4]}
+    finally:
+        conn.close()
+
+
+def run_scrape(db_path: str = DB_PATH, refresh: bool = False) -> None:
+    """
+    Phase 2: Scrape detail pages for all pending laptops (with refresh=True,
+    also re-check the already scraped ones).
+    A failed re-check leaves a scraped laptop marked scraped with its old details.
+    """
     print("\n" + "─" * 60)
     print("PHASE 2: Scrape laptop details")
     print("─" * 60)
 
-    conn = sqlite3.connect(db_path)
-    pending = conn.execute(
-        "SELECT id, slug, url FROM laptops WHERE scraped_details = 0 ORDER BY id"
-    ).fetchall()
+    # Catch up rows a previous run committed but died before deriving (the
+    # nothing-pending return below would otherwise leave them NULL for good)
+    conn = connect_db(db_path)
+    derive_numeric_columns(conn)
     conn.close()
-    pending = [{"id": r[0], "slug": r[1], "url": r[2]} for r in pending]
 
-    if not pending:
-        conn = sqlite3.connect(db_path)
+    # Count only (served by ix_laptops_pending); rows are streamed later
+    conn = connect_ro(db_path)
+    if refresh:
+        n_pending = conn.execute("SELECT COUNT(*) FROM laptops").fetchone()[0]
+    else:
+        n_pending = conn.execute("SELECT COUNT(*) FROM laptops WHERE scraped_details = 0").fetchone()[0]
+    if not n_pending:
         total = conn.execute("SELECT COUNT(*) FROM laptops").fetchone()[0]
         print(f"\n  ✓ All {total} laptops already scraped. Nothing to do.")
         conn.close()
         return
+    conn.close()
 
-    print(f"\n  Pending: {len(pending)}  |  Workers: {MAX_WORKERS}  |  Retries: {MAX_RETRIES}")
+    print(f"\n  Pending: {n_pending}  |  Workers: {MAX_WORKERS}  |  Retries: {MAX_RETRIES}")
     print()
 
-    from functools import partial
-
-    _stats["success"] = 0
-    _stats["failed"] = 0
+    # Tallied here from each job's result, so workers share no counters
+    n_success = n_failed = 0
     start = time.time()
 
-    worker_fn = partial(_worker, db_path=db_path)
+    # Filled by the writer; only read after writer.join()
+    unsaved: list[int] = []
+    _writer_stopped.clear()
+    writer = threading.Thread(target=_writer, args=(db_path, unsaved), name="db-writer")
+    writer.start()
 
-    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-        futures = {executor.submit(worker_fn, lap): lap for lap in pending}
-        for future in as_completed(futures):
-            if shutdown_event.is_set():
-                for f in futures:
-                    f.cancel()
-                break
-            laptop = futures[future]
+    # Jobs are fed from the pending cursor through a fixed window of futures,
+    # so memory stays flat however many laptops are pending.
+    laptops = iter_pending_laptops(db_path, refresh)
+    try:
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+            inflight = {executor.submit(_worker, lap): lap for lap in islice(laptops, SCRAPE_WINDOW)}
+            while inflight:
+                done, _ = wait(inflight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    laptop = inflight.pop(future)
+                    try:
+                        lid, ok, msg = future.result()
+                        if ok:
+                            n_success += 1
+                        elif msg != "shutdown":
+                            n_failed += 1
+                        sym = "✓" if ok else "✗"
+                        print(f"  [{n_success + n_failed}/{n_pending}] {sym} #{lid} {laptop['slug'][:50]}  {msg}")
+                    except Exception as e:
+                        print(f"  ✗ #{laptop['id']} {laptop['slug'][:50]}  ERROR: {e}")
+                if shutdown_event.is_set():
+                    for f in inflight:
+                        f.cancel()
+                    break
+                for lap in islice(laptops, len(done)):
+                    inflight[executor.submit(_worker, lap)] = lap
+    finally:
+        laptops.close()
+        # All workers have returned; flush what's queued and stop the writer
+        _put_write(None)
+        writer.join()
+        # Anything still queued was never written (the writer died early)
+        while True:
             try:
-                lid, ok, msg = future.result()
-                sym = "✓" if ok else "✗"
-                with _stats_lock:
-                    done = _stats["success"] + _stats["failed"]
-                print(f"  [{done}/{len(pending)}] {sym} #{lid} {laptop['slug'][:50]}  {msg}")
-            except Exception as e:
-                print(f"  ✗ #{laptop['id']} {laptop['slug'][:50]}  ERROR: {e}")
+                item = _write_q.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None:
+                unsaved.append(item[0])
+        # Numeric columns are derived in one SQL pass once all text is
+        # written, even if the scrape loop raised
+        conn = connect_db(db_path)
+        derive_numeric_columns(conn)
+        conn.close()
+
+    # Jobs are reported OK once queued; move those whose batch never committed
+    n_success -= len(unsaved)
+    n_failed += len(unsaved)
 
     elapsed = time.time() - start
-    conn = sqlite3.connect(db_path)
+    conn = connect_ro(db_path)
     total = conn.execute("SELECT COUNT(*) FROM laptops").fetchone()[0]
     done = conn.execute("SELECT COUNT(*) FROM laptops WHERE scraped_details = 1").fetchone()[0]
     remaining = total - done
 
     print(f"\n  Elapsed:   {elapsed:.1f}s")
-    print(f"  Success:   {_stats['success']}")
-    print(f"  Failed:    {_stats['failed']}")
+    print(f"  Success:   {n_success}")
+    print(f"  Failed:    {n_failed}")
+    if unsaved:
+        print(f"             (incl. {len(unsaved)} scraped but not saved — DB write failed)")
     print(f"  Remaining: {remaining}")
 
     if remaining > 0:
@@ -650,6 +1066,8 @@ def main():
     parser = argparse.ArgumentParser(description="Exo.ir Laptop Scraper")
     parser.add_argument("--catalog", action="store_true", help="Run Phase 1 only (catalog)")
     parser.add_argument("--scrape", action="store_true", help="Run Phase 2 only (details)")
+    parser.add_argument("--refresh", action="store_true",
+                        help="Re-check already scraped laptops (unchanged pages are skipped via ETag)")
     parser.add_argument("--db", default=DB_PATH, help=f"Database path (default: {DB_PATH})")
     args = parser.parse_args()
 
@@ -668,12 +1086,14 @@ def main():
         run_catalog(db)
 
     if run_phase2 and not shutdown_event.is_set():
-        run_scrape(db)
-        
+        run_scrape(db, refresh=args.refresh)
+
     if not shutdown_event.is_set():
         # Only export JSON if we didn't get cancelled via Ctrl+C
         export_to_json(db)
 
+    finalize_db(db)
+
     print("\n" + "═" * 60)
     print("  All done!")
     print("═" * 60)